@@ -1,34 +1,101 @@
 #!/usr/bin/env python3
 """
 Startup script for the Diego Chatbot backend API server
+
+Development (default): single process with auto-reload.
+Production (--prod): index prepared once up front, then several workers
+without reload that memory-map a shared read-only index snapshot.
 """
 
+import argparse
+import signal
 import subprocess
 import sys
 import os
 from pathlib import Path
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the Diego Chatbot backend API server")
+    parser.add_argument("--prod", action="store_true", help="Run in production mode (multiple workers, no reload)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")), help="Number of worker processes in production mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds to let in-flight requests finish on shutdown")
+    return parser.parse_args()
+
+def prepare_index(project_root: Path) -> bool:
+    """Ingest if needed, publish the shared index snapshot and precompute starter answers once"""
+    sys.path.insert(0, str(project_root))
+    from backend import api_server
+
+    if not api_server.initialize_chatbot(warm_up=False):
+        return False
+    api_server.warm_up_answers()
+    return True
+
+def run_production(args, project_root: Path):
+    # Workers inherit these and map the snapshot instead of each building their own index
+    os.environ["VECTOR_ENGINE"] = "numpy"
+    os.environ["INDEX_SNAPSHOT"] = "1"
+
+    print("Preparing shared index snapshot...")
+    if not prepare_index(project_root):
+        print("Error preparing index. Aborting.")
+        sys.exit(1)
+
+    print(f"Starting {args.workers} workers...")
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn",
+        "backend.api_server:app",
+        "--host", args.host,
+        "--port", str(args.port),
+        "--workers", str(args.workers),
+        "--timeout-graceful-shutdown", str(args.graceful_timeout),
+    ])
+
+    # Forward termination so uvicorn can drain in-flight requests before exiting
+    def forward_signal(signum, frame):
+        process.send_signal(signum)
+    signal.signal(signal.SIGTERM, forward_signal)
+
+    try:
+        return_code = process.wait()
+    except KeyboardInterrupt:
+        # The terminal already delivered SIGINT to uvicorn; wait for it to drain
+        return_code = process.wait()
+        print("\nBackend server stopped.")
+
+    if return_code not in (0, -signal.SIGTERM, -signal.SIGINT):
+        print(f"Backend server exited with code {return_code}")
+        sys.exit(return_code)
+
 def main():
+    args = parse_args()
+
     # Change to the project root directory
     project_root = Path(__file__).parent.parent
     os.chdir(project_root)
-    
+
     print("Starting Diego Chatbot Backend API Server...")
     print("Working directory:", os.getcwd())
-    
+
     # Check if .env file exists
     env_path = project_root / '.env'
     if not env_path.exists():
         print("Warning: .env file not found. Please create one with your API keys.")
         print("Required variables: OPENAI_API_KEY, LANGCHAIN_API_KEY")
-    
+
+    if args.prod:
+        run_production(args, project_root)
+        return
+
     try:
         # Start the FastAPI server
         subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "backend.api_server:app", 
-            "--host", "0.0.0.0", 
-            "--port", "8000", 
+            sys.executable, "-m", "uvicorn",
+            "backend.api_server:app",
+            "--host", args.host,
+            "--port", str(args.port),
             "--reload"
         ], check=True)
     except KeyboardInterrupt:
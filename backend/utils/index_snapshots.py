@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Index snapshot management
+
+Lists, exports and restores the versioned index snapshots in
+INDEX_SNAPSHOT_DIR. Restoring loads chunks and stored embeddings straight
+into Chroma, so a fresh instance or a rollback makes no embedding calls.
+On a running server prefer POST /api/index/rollback, which also refreshes
+the server's in-memory indexes.
+
+Usage:
+    python backend/utils/index_snapshots.py list
+    python backend/utils/index_snapshots.py export
+    python backend/utils/index_snapshots.py restore <version>
+    python backend/utils/index_snapshots.py rollback
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Run from the project root so the backend's relative paths resolve
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+os.chdir(PROJECT_ROOT)
+
+from backend import api_server
+from backend.api_server import (
+    INDEX_SNAPSHOT_DIR,
+    index_config_hash,
+    list_snapshots,
+    read_snapshot_pointer,
+)
+
+
+def print_snapshots():
+    current = read_snapshot_pointer(INDEX_SNAPSHOT_DIR)
+    snapshots = list_snapshots(INDEX_SNAPSHOT_DIR)
+    if not snapshots:
+        print(f"No snapshots in {INDEX_SNAPSHOT_DIR}")
+        return
+
+    config_hash = index_config_hash()
+    header = f"  {'version':<16} {'created':<19} {'chunks':>7} {'model':<24} {'settings':<9}"
+    print(header)
+    print("-" * len(header))
+    for manifest in snapshots:
+        marker = "*" if manifest["version"] == current else " "
+        created = datetime.fromtimestamp(manifest["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        settings = "current" if manifest.get("config_hash") == config_hash else "differs"
+        print(
+            f"{marker} {manifest['version']:<16} {created:<19} {manifest.get('chunks', '?'):>7} "
+            f"{manifest.get('embedding_model', '?'):<24} {settings:<9}"
+        )
+    print("\n* current snapshot")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned index snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List snapshots, oldest first")
+    subparsers.add_parser("export", help="Publish the current Chroma index as a new snapshot")
+    restore_parser = subparsers.add_parser("restore", help="Make a snapshot the live index")
+    restore_parser.add_argument("version")
+    subparsers.add_parser("rollback", help="Restore the snapshot before the current one")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print_snapshots()
+        return
+
+    # An empty database is filled from the current snapshot (or by ingesting) first
+    if not api_server.initialize_chatbot(warm_up=False):
+        print("ERROR: Could not initialize the backend")
+        sys.exit(1)
+
+    try:
+        if args.command == "export":
+            version = api_server.publish_index_snapshot(api_server.numpy_index)
+            if version is None:
+                print("ERROR: The index is empty, nothing to export")
+                sys.exit(1)
+            print(f"Published index snapshot {version}")
+        elif args.command == "restore":
+            print(f"Restored index snapshot {api_server.restore_index_snapshot(args.version)}")
+        else:
+            print(f"Rolled back to index snapshot {api_server.rollback_index_snapshot()}")
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    print()
+    print_snapshots()
+
+
+if __name__ == "__main__":
+    main()
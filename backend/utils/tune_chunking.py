@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Chunking evaluation harness
+
+Re-chunks the data folder under a grid of chunk size / overlap settings,
+builds throwaway Chroma, BM25 and (with VECTOR_ENGINE=numpy) NumPy indexes
+for each, and runs a fixed question set with expected source files through
+the same retrieval as chat: hybrid BM25 + vector fusion over candidate_k
+candidates, filtered by category down to k. For every configuration (and
+each retrieval k) it reports recall@k, chunk count, index size on disk,
+prompt tokens after context truncation and retrieval latency, so RAG_CONFIG
+can be tuned on numbers rather than by hand.
+
+Usage:
+    python backend/utils/tune_chunking.py
+    python backend/utils/tune_chunking.py --chunk-sizes 400,800,1000 --overlaps 100,200 --k 3,4,5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Run from the project root so the backend's relative paths resolve
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+os.chdir(PROJECT_ROOT)
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_openai.embeddings import OpenAIEmbeddings
+
+from backend.api_server import (
+    DATA_PATH,
+    RAG_CONFIG,
+    SYSTEM_PROMPT,
+    LexicalIndex,
+    NumpyVectorIndex,
+    build_knowledge,
+    chunk_documents,
+    classify_query_type,
+    load_documents,
+    retrieve_documents,
+    search_by_vector,
+    token_manager,
+)
+
+QUESTIONS_PATH = "backend/utils/eval_questions.json"
+
+
+class CachedEmbeddings(Embeddings):
+    """Embed each distinct text once per run, so overlapping configurations share embedding calls"""
+
+    def __init__(self, model: str):
+        self.embeddings = OpenAIEmbeddings(model=model)
+        self.cache = {}
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        missing = list(dict.fromkeys(text for text in texts if text not in self.cache))
+        if missing:
+            self.calls += 1
+            for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+                self.cache[text] = vector
+        return [self.cache[text] for text in texts]
+
+    def embed_query(self, text):
+        if text not in self.cache:
+            self.calls += 1
+            self.cache[text] = self.embeddings.embed_query(text)
+        return self.cache[text]
+
+
+def parse_int_list(value: str):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def squash(text: str) -> str:
+    """Lowercase and drop whitespace, so PDF spacing quirks like 'multi -sensor' still match"""
+    return "".join(text.lower().split())
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def question_recall(docs, expected_sources, expected_terms) -> float:
+    """
+    Fraction of expected source files covered by the retrieved chunks
+
+    When expected terms are given, a chunk only covers its source if it
+    contains at least one of them.
+    """
+    terms = [squash(term) for term in expected_terms]
+    covered = set()
+    for doc in docs:
+        source = os.path.basename(doc.metadata.get("source_file", ""))
+        if source not in expected_sources:
+            continue
+        if terms and not any(term in squash(doc.page_content) for term in terms):
+            continue
+        covered.add(source)
+    return len(covered) / len(expected_sources) if expected_sources else 0.0
+
+
+def evaluate_configuration(raw_documents, markdown_docs, questions, embeddings, chunk_size, chunk_overlap, ks):
+    """Build throwaway indexes for one chunking setting and score production retrieval for each k"""
+    chunks = chunk_documents(raw_documents, markdown_docs, chunk_size, chunk_overlap)
+    ids = [str(i) for i in range(len(chunks))]
+    system_tokens = token_manager.count_tokens(SYSTEM_PROMPT)
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="chunk_tuning_", ignore_cleanup_errors=True) as index_dir:
+        store = Chroma(
+            collection_name="chunk_tuning",
+            embedding_function=embeddings,
+            persist_directory=index_dir,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+        store.add_documents(documents=chunks, ids=ids)
+        index_bytes = directory_size(index_dir)
+
+        lexical = LexicalIndex(
+            os.path.join(index_dir, "lexical_index.json"),
+            k1=RAG_CONFIG["bm25_k1"],
+            b=RAG_CONFIG["bm25_b"],
+        )
+        lexical.add_documents(ids, chunks)
+
+        vector_index = None
+        if RAG_CONFIG["vector_engine"] == "numpy":
+            vector_index = NumpyVectorIndex()
+            vector_index.sync_with_store(store)
+
+        # Query embeddings are cached, so latency covers search, fusion and filtering only
+        def search(message, k, categories=None):
+            return search_by_vector(embeddings.embed_query(message), k, categories, store=store, vector_index=vector_index)
+
+        for k in ks:
+            recalls = []
+            prompt_tokens = []
+            latencies = []
+            for question in questions:
+                start = time.perf_counter()
+                docs = retrieve_documents(
+                    question["question"],
+                    classify_query_type(question["question"]),
+                    lexical=lexical,
+                    search=search,
+                    retrieval_k=k,
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+
+                recalls.append(question_recall(
+                    docs,
+                    question["expected_sources"],
+                    question.get("expected_terms", []),
+                ))
+                knowledge, _ = build_knowledge(docs, token_manager.max_context_tokens)
+                prompt_tokens.append(system_tokens + token_manager.count_tokens(knowledge))
+
+            results.append({
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "k": k,
+                "recall_at_k": statistics.mean(recalls),
+                "chunks": len(chunks),
+                "index_bytes": index_bytes,
+                "prompt_tokens_avg": statistics.mean(prompt_tokens),
+                "latency_ms_p50": statistics.median(latencies),
+                "latency_ms_max": max(latencies),
+            })
+
+    return results
+
+
+def print_results(results):
+    current = (RAG_CONFIG["chunk_size"], RAG_CONFIG["chunk_overlap"], RAG_CONFIG["retrieval_k"])
+    header = f"{'size':>6} {'overlap':>7} {'k':>3} {'recall@k':>9} {'chunks':>7} {'index KiB':>10} {'prompt tok':>11} {'p50 ms':>8} {'max ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        marker = " *" if (row["chunk_size"], row["chunk_overlap"], row["k"]) == current else ""
+        print(
+            f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['k']:>3} "
+            f"{row['recall_at_k']:>9.2f} {row['chunks']:>7} {row['index_bytes'] / 1024:>10.0f} "
+            f"{row['prompt_tokens_avg']:>11.0f} {row['latency_ms_p50']:>8.2f} {row['latency_ms_max']:>8.2f}{marker}"
+        )
+    print("\n* current RAG_CONFIG setting")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate chunking settings against a fixed question set")
+    parser.add_argument("--chunk-sizes", type=parse_int_list, default=[400, 600, 800, 1000, 1500])
+    parser.add_argument("--overlaps", type=parse_int_list, default=[0, 100, 200])
+    parser.add_argument("--k", type=parse_int_list, default=[3, 4, 5])
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="JSON list of {question, expected_sources, expected_terms}")
+    parser.add_argument("--output", help="Optional path to write the results as JSON")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    print(f"Loading documents from {os.path.abspath(DATA_PATH)}...")
+    raw_documents, markdown_docs = load_documents(DATA_PATH)
+    if not raw_documents:
+        print("ERROR: No documents found!")
+        sys.exit(1)
+
+    embeddings = CachedEmbeddings(RAG_CONFIG["embedding_model"])
+    for question in questions:
+        embeddings.embed_query(question["question"])
+
+    results = []
+    for chunk_size in args.chunk_sizes:
+        for chunk_overlap in args.overlaps:
+            if chunk_overlap >= chunk_size:
+                continue
+            print(f"\nEvaluating chunk_size={chunk_size}, chunk_overlap={chunk_overlap}...")
+            results.extend(evaluate_configuration(
+                raw_documents,
+                markdown_docs,
+                questions,
+                embeddings,
+                chunk_size,
+                chunk_overlap,
+                args.k,
+            ))
+
+    print(f"\nEvaluated {len(results)} configurations on {len(questions)} questions ({embeddings.calls} embedding calls)\n")
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,7 @@ function App() {
   const [isLoading, setIsLoading] = useState(false)
   const terminalRef = useRef<HTMLDivElement>(null)
   const inputRef = useRef<HTMLInputElement>(null)
+  const sessionIdRef = useRef<string | null>(null)
 
   const addMessage = (type: Message['type'], content: string) => {
     const newMessage: Message = {
@@ -162,6 +163,7 @@ function App() {
 
       case 'clear':
         setMessages([])
+        sessionIdRef.current = null
         return ''
 
       case 'sudo':
@@ -183,9 +185,12 @@ function App() {
           const response = await fetch('/api/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ message: command })
+            body: JSON.stringify({ message: command, session_id: sessionIdRef.current })
           })
           const result = await response.json()
+          if (result.session_id) {
+            sessionIdRef.current = result.session_id
+          }
           return result.response || 'No response received'
         } catch (error) {
           return `Unknown command: ${cmd}. Type \'help\' for available commands, or try chatting naturally!`